@@ -433,6 +433,9 @@ def get_users_list(logger) -> Dict[str, Any]:
             users_data = {}
             for item in response["Items"]:
                 user_id = item["user_id"]
+                # cost# and usage_agg# partitions hold derived records, not users
+                if "#" in user_id:
+                    continue
                 if user_id not in users_data:
                     users_data[user_id] = {
                         "user_id": user_id,
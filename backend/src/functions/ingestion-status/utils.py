@@ -10,16 +10,23 @@ from typing import Any, Dict, Optional, Tuple
 import boto3
 from botocore.exceptions import ClientError
 
+# Compact separators: response bodies are read by clients, not people
+_json_encoder = json.JSONEncoder(separators=(",", ":"))
+
+
+_CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token",
+    "Access-Control-Allow-Methods": "GET,POST,OPTIONS",
+}
+
 
 def get_cors_headers() -> Dict[str, str]:
     """Return basic CORS headers for API responses (legacy function)"""
     # This is kept for backward compatibility
     # New code should use security_headers module for comprehensive security
-    return {
-        "Access-Control-Allow-Origin": "*",
-        "Access-Control-Allow-Headers": "Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token",
-        "Access-Control-Allow-Methods": "GET,POST,OPTIONS",
-    }
+    # Copied from the module constant: callers and middleware update it in place
+    return _CORS_HEADERS.copy()
 
 
 def create_response(
@@ -33,7 +40,7 @@ def create_response(
     return {
         "statusCode": status_code,
         "headers": response_headers,
-        "body": json.dumps(body),
+        "body": _json_encoder.encode(body),
     }
 
 
@@ -56,7 +63,7 @@ def create_secure_response(
         response = {
             "statusCode": status_code,
             "headers": response_headers,
-            "body": json.dumps(body),
+            "body": _json_encoder.encode(body),
         }
 
         # Add comprehensive security headers
@@ -95,6 +102,15 @@ def get_current_month() -> str:
     return datetime.utcnow().strftime("%Y-%m")
 
 
+def get_aggregate_key(user_id: str, month: str) -> Dict[str, str]:
+    """Key of the per-month operation counters item
+
+    Kept in its own usage_agg# partition, like cost# records, so readers of a
+    user's daily records never see it.
+    """
+    return {"user_id": f"usage_agg#{user_id}", "date": month}
+
+
 def calculate_ttl(days: int = 32) -> int:
     """Calculate TTL timestamp for DynamoDB (default 32 days)"""
     return int((datetime.utcnow() + timedelta(days=days)).timestamp())
@@ -164,6 +180,8 @@ class UsageTracker:
                 }
             )
 
+            self._increment_operation_counters(user_id, month, operation)
+
             return True, {
                 "daily_used": daily_count + 1,
                 "daily_limit": self.daily_limit,
@@ -175,6 +193,21 @@ class UsageTracker:
             print(f"Error checking usage: {e}")
             return False, {"error": "Usage tracking error"}
 
+    def _increment_operation_counters(
+        self, user_id: str, month: str, operation: str
+    ) -> None:
+        """Atomically bump the month's per-operation and total counters"""
+        try:
+            self.table.update_item(
+                Key=get_aggregate_key(user_id, month),
+                UpdateExpression="ADD #op :one, total_count :one SET #ttl = :ttl",
+                ExpressionAttributeNames={"#op": f"{operation}_count", "#ttl": "ttl"},
+                ExpressionAttributeValues={":one": 1, ":ttl": calculate_ttl()},
+            )
+        except ClientError as e:
+            # Counters only feed reporting; never block the request on them
+            print(f"Error updating operation counters: {e}")
+
     def get_usage_stats(self, user_id: str) -> Dict[str, Any]:
         """Get current usage statistics for user"""
         today = get_current_date()
@@ -596,7 +596,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 
                         sources.append(source_obj)
 
-        context = "\n\n".join(context_pieces)
+        context_text = "\n\n".join(context_pieces)
 
         # Step 2: Generate response using Bedrock with context
         prompt = f"""Human: You are a helpful assistant that answers questions based on product manuals and documentation.
@@ -604,7 +604,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 Use the following context to answer the user's question. If the context doesn't contain relevant information, say so clearly.
 
 Context:
-{context}
+{context_text}
 
 Question: {question}
 
@@ -3,10 +3,17 @@ Manuel - Usage Function
 Handles user usage statistics and quota information
 """
 
+import json
 import os
 import sys
+import threading
+import time
+from bisect import bisect_right
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
-from typing import Any, Dict, List
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
 
 import boto3
 from boto3.dynamodb.conditions import Key
@@ -18,10 +25,80 @@ sys.path.append("../../shared")
 from utils import (  # noqa: E402
     UsageTracker,
     create_response,
+    get_aggregate_key,
+    get_cors_headers,
     get_user_id_from_event,
     handle_options_request,
 )
 
+# DynamoDB accepts at most 100 keys per BatchGetItem request
+BATCH_GET_LIMIT = 100
+BATCH_GET_MAX_ATTEMPTS = 5
+
+# Usage percentages at which each quota status starts, lowest first
+QUOTA_STATUS_THRESHOLDS = (50, 75, 90, 100)
+QUOTA_STATUSES = ("OK", "MODERATE", "WARNING", "CRITICAL", "EXCEEDED")
+
+
+# boto3 sessions and resources are not thread-safe, so each thread (including
+# the executor's workers) keeps its own DynamoDB handles. They are all built
+# from one session under a lock, so the service model is loaded only once.
+_session_lock = threading.Lock()
+_session: Any = None
+_thread_local = threading.local()
+
+# Reused across warm invocations; sized for the reads in handle_get_usage
+EXECUTOR_WORKERS = 5
+_executor = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS)
+
+
+def _get_dynamodb() -> Any:
+    """DynamoDB resource for the current thread, created on first use"""
+    global _session
+
+    dynamodb = getattr(_thread_local, "dynamodb", None)
+    if dynamodb is None:
+        with _session_lock:
+            if _session is None:
+                _session = boto3.session.Session()
+            dynamodb = _thread_local.dynamodb = _session.resource("dynamodb")
+    return dynamodb
+
+
+def _get_table(table_name: str) -> Any:
+    """DynamoDB table handle for the current thread, reused across invocations"""
+    tables = getattr(_thread_local, "tables", None)
+    if tables is None:
+        tables = _thread_local.tables = {}
+    if table_name not in tables:
+        tables[table_name] = _get_dynamodb().Table(table_name)
+    return tables[table_name]
+
+
+def _warm_workers(table_name: str) -> None:
+    """Build every executor worker's DynamoDB handles ahead of the first request"""
+    # Each task holds its worker until all have started, so every worker gets one
+    barrier = threading.Barrier(EXECUTOR_WORKERS)
+
+    def warm() -> None:
+        _get_table(table_name)
+        barrier.wait(timeout=10)
+
+    for future in [_executor.submit(warm) for _ in range(EXECUTOR_WORKERS)]:
+        future.result()
+
+
+# Inside Lambda, load the DynamoDB model during init rather than on a request:
+# the executor workers read through _get_table, and the handler thread through
+# UsageTracker, which uses boto3's default session. Elsewhere (unit tests, local
+# runs) both stay lazy and patchable.
+if "AWS_LAMBDA_FUNCTION_NAME" in os.environ and "USAGE_TABLE_NAME" in os.environ:
+    try:
+        _warm_workers(os.environ["USAGE_TABLE_NAME"])
+        boto3.resource("dynamodb")
+    except Exception as e:
+        print(f"Error warming DynamoDB handles: {str(e)}")
+
 
 def convert_decimal_to_number(obj):
     """Convert Decimal objects to regular numbers for JSON serialization"""
@@ -34,6 +111,21 @@ def convert_decimal_to_number(obj):
     return obj
 
 
+@lru_cache(maxsize=None)
+def _error_body(message: str) -> str:
+    """Serialized error body; the handler's messages are fixed strings"""
+    return json.dumps({"error": message}, separators=(",", ":"))
+
+
+def _error_response(status_code: int, message: str) -> Dict[str, Any]:
+    """Error response reusing the cached body for its message"""
+    return {
+        "statusCode": status_code,
+        "headers": get_cors_headers(),
+        "body": _error_body(message),
+    }
+
+
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Handle usage and quota requests
@@ -49,7 +141,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     # Get user ID from JWT token
     user_id = get_user_id_from_event(event)
     if not user_id:
-        return create_response(401, {"error": "Unauthorized"})
+        return _error_response(401, "Unauthorized")
 
     # Route based on path
     path = event.get("path", "")
@@ -59,26 +151,25 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     elif path.endswith("/quota"):
         return handle_get_quota(user_id)
     else:
-        return create_response(404, {"error": "Endpoint not found"})
+        return _error_response(404, "Endpoint not found")
 
 
 def handle_get_usage(user_id: str) -> Dict[str, Any]:
     """Get detailed usage statistics for user."""
     try:
-        usage_tracker = UsageTracker()
-
-        # Get current usage stats
-        current_stats = usage_tracker.get_usage_stats(user_id)
-
-        # Get historical usage (last 7 days)
-        historical_usage = get_historical_usage(user_id, days=7)
-
-        # Get usage by operation type
-        operation_breakdown = get_operation_breakdown(user_id)
-
-        # Calculate actual costs
-        daily_costs = get_daily_costs(user_id)
-        monthly_costs = get_monthly_costs(user_id)
+        # The reads are independent DynamoDB round-trips, so overlap them; the
+        # tracker's own read stays on this thread, which built its resource
+        historical_future = _executor.submit(get_historical_usage, user_id, days=7)
+        breakdown_future = _executor.submit(get_operation_breakdown, user_id)
+        daily_costs_future = _executor.submit(get_daily_costs, user_id)
+        monthly_costs_future = _executor.submit(get_monthly_costs, user_id)
+        recent_future = _executor.submit(get_recent_queries, user_id, limit=5)
+
+        current_stats = UsageTracker().get_usage_stats(user_id)
+        historical_usage = historical_future.result()
+        operation_breakdown = breakdown_future.result()
+        daily_costs = daily_costs_future.result()
+        monthly_costs = monthly_costs_future.result()
 
         # Format response to match frontend expectations
         response_data = {
@@ -106,7 +197,7 @@ def handle_get_usage(user_id: str) -> Dict[str, Any]:
                 "service_breakdown": monthly_costs.get("services", {}),
                 "currency": "EUR",
             },
-            "recent_queries": get_recent_queries(user_id, limit=5),
+            "recent_queries": recent_future.result(),
             "user_id": user_id,
             "historical": historical_usage,
             "breakdown": operation_breakdown,
@@ -118,7 +209,19 @@ def handle_get_usage(user_id: str) -> Dict[str, Any]:
 
     except Exception as e:
         print(f"Error getting usage stats: {str(e)}")
-        return create_response(500, {"error": "Failed to get usage statistics"})
+        return _error_response(500, "Failed to get usage statistics")
+
+
+def _quota(used: int, limit: int) -> Tuple[Dict[str, Any], float]:
+    """One quota's response entry, plus its unrounded percent for status checks"""
+    remaining = limit - used
+    percent = used * 100 / limit if limit > 0 else 0
+    return {
+        "limit": limit,
+        "used": used,
+        "remaining": remaining if remaining > 0 else 0,
+        "percent_used": round(percent, 1),
+    }, percent
 
 
 def handle_get_quota(user_id: str) -> Dict[str, Any]:
@@ -129,38 +232,12 @@ def handle_get_quota(user_id: str) -> Dict[str, Any]:
         # Get current usage
         stats = usage_tracker.get_usage_stats(user_id)
 
-        # Calculate remaining quota
-        daily_remaining = max(0, stats["daily_limit"] - stats["daily_used"])
-        monthly_remaining = max(0, stats["monthly_limit"] - stats["monthly_used"])
-
-        # Calculate percentages
-        daily_percent = (
-            (stats["daily_used"] / stats["daily_limit"]) * 100
-            if stats["daily_limit"] > 0
-            else 0
-        )
-        monthly_percent = (
-            (stats["monthly_used"] / stats["monthly_limit"]) * 100
-            if stats["monthly_limit"] > 0
-            else 0
-        )
+        daily, daily_percent = _quota(stats["daily_used"], stats["daily_limit"])
+        monthly, monthly_percent = _quota(stats["monthly_used"], stats["monthly_limit"])
 
         response_data = {
             "user_id": user_id,
-            "quotas": {
-                "daily": {
-                    "limit": stats["daily_limit"],
-                    "used": stats["daily_used"],
-                    "remaining": daily_remaining,
-                    "percent_used": round(daily_percent, 1),
-                },
-                "monthly": {
-                    "limit": stats["monthly_limit"],
-                    "used": stats["monthly_used"],
-                    "remaining": monthly_remaining,
-                    "percent_used": round(monthly_percent, 1),
-                },
-            },
+            "quotas": {"daily": daily, "monthly": monthly},
             "status": determine_quota_status(daily_percent, monthly_percent),
             "last_operation": stats.get("last_operation"),
             "last_updated": stats.get("last_updated"),
@@ -172,116 +249,73 @@ def handle_get_quota(user_id: str) -> Dict[str, Any]:
 
     except Exception as e:
         print(f"Error getting quota info: {str(e)}")
-        return create_response(500, {"error": "Failed to get quota information"})
+        return _error_response(500, "Failed to get quota information")
 
 
-def get_historical_usage(user_id: str, days: int = 7) -> List[Dict[str, Any]]:
-    """Get historical usage for the last N days."""
-    try:
-        dynamodb = boto3.resource("dynamodb")
-        table = dynamodb.Table(os.environ["USAGE_TABLE_NAME"])
+def _batch_get_items(
+    dynamodb: Any, table_name: str, keys: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """Fetch items with BatchGetItem, retrying any UnprocessedKeys"""
+    items: List[Dict[str, Any]] = []
 
-        from datetime import datetime, timedelta
+    for start in range(0, len(keys), BATCH_GET_LIMIT):
+        request_items = {table_name: {"Keys": keys[start : start + BATCH_GET_LIMIT]}}
 
-        # Generate date range
-        end_date = datetime.utcnow()
-        start_date = end_date - timedelta(days=days)
+        for attempt in range(BATCH_GET_MAX_ATTEMPTS):
+            response = dynamodb.batch_get_item(RequestItems=request_items)
+            items.extend(response.get("Responses", {}).get(table_name, []))
 
-        historical_data = []
+            request_items = response.get("UnprocessedKeys")
+            if not request_items:
+                break
+            # Back off before retrying throttled keys, unless this was the last try
+            if attempt + 1 < BATCH_GET_MAX_ATTEMPTS:
+                time.sleep(0.05 * 2**attempt)
+        else:
+            print(f"Giving up on unprocessed keys for {table_name}")
 
-        # Query each day
-        # Build batch request keys for better performance
-        batch_keys = []
-        date_list = []
+    return items
 
-        for i in range(days):
-            query_date = (start_date + timedelta(days=i)).strftime("%Y-%m-%d")
-            date_list.append(query_date)
-            batch_keys.append({"user_id": user_id, "date": query_date})
 
-        try:
-            # Use batch_get_item for better performance (up to 100 items)
-            if len(batch_keys) <= 100:
-                response = dynamodb.batch_get_item(
-                    RequestItems={table.name: {"Keys": batch_keys}}
-                )
+def get_historical_usage(user_id: str, days: int = 7) -> List[Dict[str, Any]]:
+    """Get historical usage for the last N days."""
+    try:
+        dynamodb = _get_dynamodb()
+        table = _get_table(os.environ["USAGE_TABLE_NAME"])
 
-                # Create lookup dict for retrieved items
-                items_by_date = {}
-                for item in response.get("Responses", {}).get(table.name, []):
-                    items_by_date[item["date"]] = item
-
-                # Build historical data with retrieved items
-                for query_date in date_list:
-                    if query_date in items_by_date:
-                        item = items_by_date[query_date]
-                        historical_data.append(
-                            {
-                                "date": query_date,
-                                "daily_count": int(item.get("daily_count", 0)),
-                                "operations": dict(item.get("operations", {})),
-                            }
-                        )
-                    else:
-                        historical_data.append(
-                            {"date": query_date, "daily_count": 0, "operations": {}}
-                        )
-            else:
-                # Fallback to individual queries for very large ranges
-                for i in range(days):
-                    query_date = (start_date + timedelta(days=i)).strftime("%Y-%m-%d")
-
-                    try:
-                        response = table.get_item(
-                            Key={"user_id": user_id, "date": query_date}
-                        )
-
-                        if "Item" in response:
-                            item = response["Item"]
-                            historical_data.append(
-                                {
-                                    "date": query_date,
-                                    "daily_count": int(item.get("daily_count", 0)),
-                                    "operations": dict(item.get("operations", {})),
-                                }
-                            )
-                        else:
-                            historical_data.append(
-                                {"date": query_date, "daily_count": 0, "operations": {}}
-                            )
-                    except ClientError as e:
-                        print(f"Error getting usage for {query_date}: {e}")
-                        historical_data.append(
-                            {"date": query_date, "daily_count": 0, "operations": {}}
-                        )
+        from datetime import date, datetime
 
+        # Generate date range from day ordinals; isoformat avoids strftime
+        start_ordinal = datetime.utcnow().date().toordinal() - days
+        date_list = [
+            date.fromordinal(start_ordinal + i).isoformat() for i in range(days)
+        ]
+
+        # One BatchGetItem round-trip per 100 days instead of one GetItem per day
+        keys = [{"user_id": user_id, "date": query_date} for query_date in date_list]
+        try:
+            items = _batch_get_items(dynamodb, table.name, keys)
         except ClientError as e:
             print(f"Error in batch_get_item: {e}")
-            # Fallback to individual queries
-            for query_date in date_list:
-                try:
-                    response = table.get_item(
-                        Key={"user_id": user_id, "date": query_date}
-                    )
-
-                    if "Item" in response:
-                        item = response["Item"]
-                        historical_data.append(
-                            {
-                                "date": query_date,
-                                "daily_count": int(item.get("daily_count", 0)),
-                                "operations": dict(item.get("operations", {})),
-                            }
-                        )
-                    else:
-                        historical_data.append(
-                            {"date": query_date, "daily_count": 0, "operations": {}}
-                        )
-                except ClientError as e:
-                    print(f"Error getting usage for {query_date}: {e}")
-                    historical_data.append(
-                        {"date": query_date, "daily_count": 0, "operations": {}}
-                    )
+            items = []
+
+        items_by_date = {item["date"]: item for item in items}
+
+        historical_data = []
+        for query_date in date_list:
+            item = items_by_date.get(query_date)
+            if item:
+                historical_data.append(
+                    {
+                        "date": query_date,
+                        "daily_count": int(item.get("daily_count", 0)),
+                        "operations": dict(item.get("operations", {})),
+                    }
+                )
+            else:
+                historical_data.append(
+                    {"date": query_date, "daily_count": 0, "operations": {}}
+                )
 
         return historical_data
 
@@ -293,35 +327,54 @@ def get_historical_usage(user_id: str, days: int = 7) -> List[Dict[str, Any]]:
 def get_operation_breakdown(user_id: str) -> Dict[str, int]:
     """Get breakdown of usage by operation type for current month."""
     try:
-        dynamodb = boto3.resource("dynamodb")
-        table = dynamodb.Table(os.environ["USAGE_TABLE_NAME"])
+        table = _get_table(os.environ["USAGE_TABLE_NAME"])
 
         from datetime import datetime
 
         # Get current month data
         current_month = datetime.utcnow().strftime("%Y-%m")
 
-        # Query all records for this user in current month
-        from boto3.dynamodb.conditions import Key
+        # Counters maintained by UsageTracker: one fixed-size read. They only
+        # count operations since they were introduced, so the month they were
+        # deployed in undercounts anything recorded before then.
+        response = table.get_item(Key=get_aggregate_key(user_id, current_month))
+        if "Item" in response:
+            item = response["Item"]
+            return {
+                "transcribe": int(item.get("transcribe_count", 0)),
+                "query": int(item.get("query_count", 0)),
+                "total": int(item.get("total_count", 0)),
+            }
 
-        response = table.query(
-            KeyConditionExpression=Key("user_id").eq(user_id)
-            & Key("date").begins_with(current_month)
-        )
+        # No counters yet for this month: sum the daily records instead,
+        # fetching only the two attributes the sum needs
+        query_kwargs = {
+            "KeyConditionExpression": Key("user_id").eq(user_id)
+            & Key("date").begins_with(current_month),
+            "ProjectionExpression": "last_operation, daily_count",
+        }
 
-        # Aggregate operation counts
-        operation_counts = {"transcribe": 0, "query": 0, "total": 0}
+        # Aggregate operation counts, unknown operations included in the total
+        operation_counts: Counter[str] = Counter()
 
-        for item in response.get("Items", []):
-            last_operation = item.get("last_operation", "")
-            daily_count = int(item.get("daily_count", 0))
+        while True:
+            response = table.query(**query_kwargs)
 
-            if last_operation in operation_counts:
-                operation_counts[last_operation] += daily_count
+            for item in response.get("Items", []):
+                operation_counts[item.get("last_operation", "")] += int(
+                    item.get("daily_count", 0)
+                )
 
-            operation_counts["total"] += daily_count
+            last_key = response.get("LastEvaluatedKey")
+            if not last_key:
+                break
+            query_kwargs["ExclusiveStartKey"] = last_key
 
-        return operation_counts
+        return {
+            "transcribe": operation_counts["transcribe"],
+            "query": operation_counts["query"],
+            "total": sum(operation_counts.values()),
+        }
 
     except Exception as e:
         print(f"Error getting operation breakdown: {str(e)}")
@@ -331,51 +384,39 @@ def get_operation_breakdown(user_id: str) -> Dict[str, int]:
 def determine_quota_status(daily_percent: float, monthly_percent: float) -> str:
     """Determine quota status based on usage percentages."""
     max_percent = max(daily_percent, monthly_percent)
-
-    if max_percent >= 100:
-        return "EXCEEDED"
-    elif max_percent >= 90:
-        return "CRITICAL"
-    elif max_percent >= 75:
-        return "WARNING"
-    elif max_percent >= 50:
-        return "MODERATE"
-    else:
-        return "OK"
+    return QUOTA_STATUSES[bisect_right(QUOTA_STATUS_THRESHOLDS, max_percent)]
 
 
 def reset_daily_quota(user_id: str) -> bool:
     """Reset daily quota for user (admin function)."""
     try:
-        dynamodb = boto3.resource("dynamodb")
-        table = dynamodb.Table(os.environ["USAGE_TABLE_NAME"])
+        table = _get_table(os.environ["USAGE_TABLE_NAME"])
 
         from datetime import datetime
 
         from utils import calculate_ttl, get_current_date
 
-        today = get_current_date()
-
-        # Reset daily count but keep monthly count
-        response = table.get_item(Key={"user_id": user_id, "date": today})
-
-        if "Item" in response:
-            item = response["Item"]
-            monthly_count = int(item.get("monthly_count", 0))
-
-            # Update with reset daily count
-            table.put_item(
-                Item={
-                    "user_id": user_id,
-                    "date": today,
-                    "month": datetime.utcnow().strftime("%Y-%m"),
-                    "daily_count": 0,
-                    "monthly_count": monthly_count,
-                    "last_operation": "quota_reset",
-                    "last_updated": datetime.utcnow().isoformat(),
-                    "ttl": calculate_ttl(),
-                }
+        # Reset daily count in place; monthly count and counters are untouched
+        try:
+            table.update_item(
+                Key={"user_id": user_id, "date": get_current_date()},
+                UpdateExpression=(
+                    "SET daily_count = :zero, last_operation = :operation, "
+                    "last_updated = :now, #ttl = :ttl"
+                ),
+                ConditionExpression="attribute_exists(user_id)",
+                ExpressionAttributeNames={"#ttl": "ttl"},
+                ExpressionAttributeValues={
+                    ":zero": 0,
+                    ":operation": "quota_reset",
+                    ":now": datetime.utcnow().isoformat(),
+                    ":ttl": calculate_ttl(),
+                },
             )
+        except ClientError as e:
+            # No usage recorded today, so there is nothing to reset
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
 
         return True
 
@@ -392,8 +433,7 @@ def get_daily_costs(user_id: str) -> Dict[str, float]:
         today = datetime.utcnow().strftime("%Y-%m-%d")
 
         # Get cost records for today
-        dynamodb = boto3.resource("dynamodb")
-        table = dynamodb.Table(os.environ["USAGE_TABLE_NAME"])
+        table = _get_table(os.environ["USAGE_TABLE_NAME"])
 
         response = table.query(
             KeyConditionExpression=Key("user_id").eq(f"cost#{user_id}")
@@ -414,8 +454,6 @@ def get_daily_costs(user_id: str) -> Dict[str, float]:
             service_costs["total"] += total_cost
 
             # Parse service costs from JSON if available
-            import json
-
             if "service_costs" in item:
                 try:
                     service_breakdown = json.loads(item["service_costs"])
@@ -449,8 +487,7 @@ def get_monthly_costs(user_id: str) -> Dict[str, Any]:
         current_month = datetime.utcnow().strftime("%Y-%m")
 
         # Get cost records for current month
-        dynamodb = boto3.resource("dynamodb")
-        table = dynamodb.Table(os.environ["USAGE_TABLE_NAME"])
+        table = _get_table(os.environ["USAGE_TABLE_NAME"])
 
         response = table.query(
             KeyConditionExpression=Key("user_id").eq(f"cost#{user_id}")
@@ -465,8 +502,6 @@ def get_monthly_costs(user_id: str) -> Dict[str, Any]:
             monthly_total += total_cost
 
             # Parse service costs
-            import json
-
             if "service_costs" in item:
                 try:
                     service_costs = json.loads(item["service_costs"])
@@ -492,8 +527,7 @@ def get_monthly_costs(user_id: str) -> Dict[str, Any]:
 def get_recent_queries(user_id: str, limit: int = 5) -> List[Dict[str, Any]]:
     """Get recent query records for user."""
     try:
-        dynamodb = boto3.resource("dynamodb")
-        table = dynamodb.Table(os.environ["USAGE_TABLE_NAME"])
+        table = _get_table(os.environ["USAGE_TABLE_NAME"])
 
         # Query recent cost records to get query information
         response = table.query(
@@ -519,9 +553,16 @@ def get_recent_queries(user_id: str, limit: int = 5) -> List[Dict[str, Any]]:
         return []
 
 
+@lru_cache(maxsize=8)
+def _parse_quota_limits(daily_quota: str, monthly_quota: str) -> Tuple[int, int]:
+    """Parse quota settings once per distinct pair of raw values"""
+    return int(daily_quota), int(monthly_quota)
+
+
 def get_quota_limits() -> Dict[str, int]:
     """Get current quota limits from environment."""
-    return {
-        "daily_limit": int(os.environ.get("DAILY_QUOTA", "50")),
-        "monthly_limit": int(os.environ.get("MONTHLY_QUOTA", "1000")),
-    }
+    # Keyed on the raw strings, so a changed environment is re-parsed
+    daily_limit, monthly_limit = _parse_quota_limits(
+        os.environ.get("DAILY_QUOTA", "50"), os.environ.get("MONTHLY_QUOTA", "1000")
+    )
+    return {"daily_limit": daily_limit, "monthly_limit": monthly_limit}
@@ -2,8 +2,10 @@
 Pytest configuration for unit tests
 """
 
+import copy
+import json
 import os
-import sys
+from types import SimpleNamespace
 from typing import Any, Dict
 from unittest.mock import MagicMock, Mock, patch
 
@@ -11,9 +13,6 @@ import boto3
 import pytest
 from moto import mock_aws
 
-# Add src directory to path for imports
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
-
 
 @pytest.fixture(autouse=True)
 def mock_boto3():
@@ -30,24 +29,44 @@ def mock_boto3():
         yield {"client": mock_client, "resource": mock_resource}
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
+def assert_error():
+    """Check an error response's status and body by substring, without json.loads"""
+
+    def _assert_error(response, status, needle=None):
+        assert response["statusCode"] == status
+        assert '"error"' in response["body"]
+        if needle:
+            assert needle in response["body"].lower()
+
+    return _assert_error
+
+
+@pytest.fixture(scope="session")
 def mock_context():
-    """Mock AWS Lambda context"""
-    context = Mock()
-    context.aws_request_id = "test-request-id-12345"
-    context.function_name = "test-function"
-    context.function_version = "$LATEST"
-    context.invoked_function_arn = (
-        "arn:aws:lambda:us-east-1:123456789012:function:test-function"
+    """Mock AWS Lambda context, shared by the whole session
+
+    A plain namespace: handlers only read attributes from the context.
+    """
+    return SimpleNamespace(
+        aws_request_id="test-request-id-12345",
+        function_name="test-function",
+        function_version="$LATEST",
+        invoked_function_arn=(
+            "arn:aws:lambda:us-east-1:123456789012:function:test-function"
+        ),
+        memory_limit_in_mb=128,
+        get_remaining_time_in_millis=lambda: 300000,
     )
-    context.memory_limit_in_mb = 128
-    context.remaining_time_in_millis = lambda: 300000
-    return context
 
 
-@pytest.fixture
+@pytest.fixture(scope="session", autouse=True)
 def mock_env_vars():
-    """Mock environment variables"""
+    """Mock environment variables, set once for the whole session
+
+    Written straight into os.environ and restored at session end, rather than
+    entering a patch.dict per test.
+    """
     env_vars = {
         "USAGE_TABLE_NAME": "test-usage-table",
         "MANUALS_BUCKET": "test-manuals-bucket",
@@ -64,8 +83,14 @@ def mock_env_vars():
         "STAGE": "test",
     }
 
-    with patch.dict(os.environ, env_vars):
-        yield env_vars
+    saved = {key: os.environ.get(key) for key in env_vars}
+    os.environ.update(env_vars)
+    yield env_vars
+    for key, value in saved.items():
+        if value is None:
+            os.environ.pop(key, None)
+        else:
+            os.environ[key] = value
 
 
 @pytest.fixture
@@ -113,9 +138,9 @@ def mock_boto3_clients():
         }
 
 
-@pytest.fixture
-def sample_event():
-    """Sample API Gateway event"""
+@pytest.fixture(scope="session")
+def _sample_event_template():
+    """Sample API Gateway event, built once per session"""
     return {
         "httpMethod": "GET",
         "path": "/api/test",
@@ -136,6 +161,16 @@ def sample_event():
     }
 
 
+@pytest.fixture
+def sample_event(_sample_event_template):
+    """Sample API Gateway event
+
+    Shallow copy of the session template: tests only reassign top-level keys
+    such as httpMethod, path and body, so nested dicts can be shared.
+    """
+    return copy.copy(_sample_event_template)
+
+
 @pytest.fixture
 def sample_s3_event():
     """Sample S3 event for manual processing"""
@@ -165,22 +200,29 @@ def mock_jwt_token():
     }
 
 
-@pytest.fixture
+_BEDROCK_RESPONSE = {
+    "output": {
+        "message": {"content": [{"text": "This is a test response from the AI model."}]}
+    },
+    "usage": {"inputTokens": 10, "outputTokens": 15, "totalTokens": 25},
+}
+
+
+@pytest.fixture(scope="session")
 def mock_bedrock_response():
-    """Mock Bedrock response"""
-    return {
-        "output": {
-            "message": {
-                "content": [{"text": "This is a test response from the AI model."}]
-            }
-        },
-        "usage": {"inputTokens": 10, "outputTokens": 15, "totalTokens": 25},
-    }
+    """Mock Bedrock response, shared read-only by the session; copy before mutating"""
+    return _BEDROCK_RESPONSE
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
+def mock_bedrock_body_bytes():
+    """Mock Bedrock response serialized once, for invoke_model body streams"""
+    return json.dumps(_BEDROCK_RESPONSE).encode()
+
+
+@pytest.fixture(scope="session")
 def mock_knowledge_base_response():
-    """Mock Knowledge Base query response"""
+    """Mock Knowledge Base query response, shared read-only by the session"""
     return {
         "retrievalResults": [
             {
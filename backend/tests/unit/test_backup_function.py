@@ -2,149 +2,121 @@
 Unit tests for Backup Lambda function
 """
 
-import json
 import os
-
-# Import the function under test
-import sys
 from datetime import datetime, timedelta
-from unittest.mock import MagicMock, Mock, patch
+from unittest.mock import DEFAULT, MagicMock, Mock, patch
 
 import pytest
 from botocore.exceptions import ClientError
 
-sys.path.insert(
-    0, os.path.join(os.path.dirname(__file__), "..", "..", "src", "functions", "backup")
-)
+# Resolved through the pytest.ini pythonpath (src/functions)
+from backup import app
 
-from app import (
-    check_dynamodb_backup_status,
-    check_s3_backup_status,
-    get_backup_metrics,
-    get_backup_status,
-    handle_backup_metrics,
-    handle_backup_status,
-    handle_backup_verify,
-    handle_disaster_recovery,
-    initiate_disaster_recovery,
-    lambda_handler,
-    verify_backup_integrity,
-    verify_dynamodb_backup,
-    verify_s3_backup,
-)
+
+@pytest.fixture(autouse=True)
+def patched_logger(monkeypatch):
+    """Replace get_logger with one cached Mock logger for every test"""
+    logger = Mock()
+    monkeypatch.setattr(app, "get_logger", lambda *args, **kwargs: logger)
+    return logger
 
 
+# (method, path) -> (patched handler, status code it responds with)
+_ROUTES = {
+    ("GET", "/backup/status"): ("handle_backup_status", 200),
+    ("GET", "/backup/metrics"): ("handle_backup_metrics", 200),
+    ("POST", "/backup/verify"): ("handle_backup_verify", 200),
+    ("POST", "/backup/restore"): ("handle_disaster_recovery", 202),
+}
+
+
+@patch.multiple(
+    app,
+    handle_backup_status=DEFAULT,
+    handle_backup_metrics=DEFAULT,
+    handle_backup_verify=DEFAULT,
+    handle_disaster_recovery=DEFAULT,
+    autospec=True,
+)
 class TestBackupLambdaHandler:
-    """Test the main lambda handler function"""
+    """Test the main lambda handler function
 
-    def test_lambda_handler_options_request(self, mock_context, mock_env_vars):
+    The class decorator patches the route handlers (autospecced) around each
+    test; every test receives them as keyword arguments and configures only the
+    one it routes to.
+    """
+
+    def test_lambda_handler_options_request(
+        self, mock_context, mock_env_vars, **handlers
+    ):
         """Test OPTIONS request handling"""
         event = {"httpMethod": "OPTIONS"}
 
-        response = lambda_handler(event, mock_context)
+        response = app.lambda_handler(event, mock_context)
 
         assert response["statusCode"] == 200
         assert "Access-Control-Allow-Origin" in response["headers"]
 
-    def test_lambda_handler_backup_status(self, mock_context, mock_env_vars):
-        """Test backup status endpoint"""
-        event = {"httpMethod": "GET", "path": "/backup/status"}
-
-        with patch("app.handle_backup_status") as mock_handle:
-            mock_handle.return_value = {
-                "statusCode": 200,
-                "body": json.dumps({"status": "healthy"}),
-            }
-
-            response = lambda_handler(event, mock_context)
-
-            assert response["statusCode"] == 200
-            mock_handle.assert_called_once()
-
-    def test_lambda_handler_backup_metrics(self, mock_context, mock_env_vars):
-        """Test backup metrics endpoint"""
-        event = {"httpMethod": "GET", "path": "/backup/metrics"}
-
-        with patch("app.handle_backup_metrics") as mock_handle:
-            mock_handle.return_value = {
-                "statusCode": 200,
-                "body": json.dumps({"metrics": {}}),
-            }
-
-            response = lambda_handler(event, mock_context)
-
-            assert response["statusCode"] == 200
-
-    def test_lambda_handler_backup_verify(self, mock_context, mock_env_vars):
-        """Test backup verification endpoint"""
-        event = {
-            "httpMethod": "POST",
-            "path": "/backup/verify",
-            "body": json.dumps({"services": ["dynamodb", "s3"]}),
-        }
-
-        with patch("app.handle_backup_verify") as mock_handle:
-            mock_handle.return_value = {
-                "statusCode": 200,
-                "body": json.dumps({"overall_status": "healthy"}),
-            }
-
-            response = lambda_handler(event, mock_context)
-
-            assert response["statusCode"] == 200
-
-    def test_lambda_handler_disaster_recovery(self, mock_context, mock_env_vars):
-        """Test disaster recovery endpoint"""
-        event = {
-            "httpMethod": "POST",
-            "path": "/backup/restore",
-            "body": json.dumps({"type": "point_in_time", "services": ["dynamodb"]}),
-        }
-
-        with patch("app.handle_disaster_recovery") as mock_handle:
-            mock_handle.return_value = {
-                "statusCode": 202,
-                "body": json.dumps({"status": "initiated"}),
-            }
-
-            response = lambda_handler(event, mock_context)
+    @pytest.mark.parametrize(
+        ("route", "target"), _ROUTES.items(), ids=[" ".join(r) for r in _ROUTES]
+    )
+    def test_lambda_handler_routes(
+        self, route, target, mock_context, mock_env_vars, **handlers
+    ):
+        """Test each endpoint is dispatched to its handler"""
+        method, path = route
+        handler_name, status_code = target
+        mock_handle = handlers[handler_name]
+        mock_handle.return_value = {"statusCode": status_code, "body": "{}"}
+
+        response = app.lambda_handler(
+            {"httpMethod": method, "path": path}, mock_context
+        )
 
-            assert response["statusCode"] == 202
+        assert response["statusCode"] == status_code
+        mock_handle.assert_called_once()
+        for name, other in handlers.items():
+            if name != handler_name:
+                other.assert_not_called()
 
-    def test_lambda_handler_invalid_endpoint(self, mock_context, mock_env_vars):
+    def test_lambda_handler_invalid_endpoint(
+        self, mock_context, mock_env_vars, **handlers
+    ):
         """Test invalid endpoint"""
         event = {"httpMethod": "GET", "path": "/backup/invalid"}
 
-        response = lambda_handler(event, mock_context)
+        response = app.lambda_handler(event, mock_context)
 
         assert response["statusCode"] == 404
 
-    def test_lambda_handler_invalid_method(self, mock_context, mock_env_vars):
+    def test_lambda_handler_invalid_method(
+        self, mock_context, mock_env_vars, **handlers
+    ):
         """Test invalid HTTP method"""
         event = {"httpMethod": "PUT", "path": "/backup/status"}
 
-        response = lambda_handler(event, mock_context)
+        response = app.lambda_handler(event, mock_context)
 
         assert response["statusCode"] == 405
 
-    def test_lambda_handler_exception(self, mock_context, mock_env_vars):
+    def test_lambda_handler_exception(
+        self, assert_error, mock_context, mock_env_vars, **handlers
+    ):
         """Test exception handling"""
         event = {"httpMethod": "GET", "path": "/backup/status"}
+        handlers["handle_backup_status"].side_effect = Exception("Test error")
 
-        with patch("app.handle_backup_status", side_effect=Exception("Test error")):
-            response = lambda_handler(event, mock_context)
+        response = app.lambda_handler(event, mock_context)
 
-            assert response["statusCode"] == 500
-            response_body = json.loads(response["body"])
-            assert "error" in response_body
+        assert_error(response, 500)
 
 
 class TestGetBackupStatus:
     """Test the get_backup_status function"""
 
-    @patch("app.check_dynamodb_backup_status")
-    @patch("app.check_s3_backup_status")
-    @patch("app.check_opensearch_backup_status")
+    @patch("backup.app.check_dynamodb_backup_status")
+    @patch("backup.app.check_s3_backup_status")
+    @patch("backup.app.check_opensearch_backup_status")
     def test_get_backup_status_all_healthy(
         self, mock_opensearch, mock_s3, mock_dynamodb
     ):
@@ -153,16 +125,16 @@ class TestGetBackupStatus:
         mock_s3.return_value = {"status": "healthy"}
         mock_opensearch.return_value = {"status": "healthy"}
 
-        result = get_backup_status()
+        result = app.get_backup_status()
 
         assert result["overall_status"] == "healthy"
         assert "timestamp" in result
         assert len(result["services"]) == 3
         assert "unhealthy_services" not in result
 
-    @patch("app.check_dynamodb_backup_status")
-    @patch("app.check_s3_backup_status")
-    @patch("app.check_opensearch_backup_status")
+    @patch("backup.app.check_dynamodb_backup_status")
+    @patch("backup.app.check_s3_backup_status")
+    @patch("backup.app.check_opensearch_backup_status")
     def test_get_backup_status_some_unhealthy(
         self, mock_opensearch, mock_s3, mock_dynamodb
     ):
@@ -171,7 +143,7 @@ class TestGetBackupStatus:
         mock_s3.return_value = {"status": "healthy"}
         mock_opensearch.return_value = {"status": "degraded"}
 
-        result = get_backup_status()
+        result = app.get_backup_status()
 
         assert result["overall_status"] == "degraded"
         assert "unhealthy_services" in result
@@ -180,6 +152,7 @@ class TestGetBackupStatus:
         assert "s3" not in result["unhealthy_services"]
 
 
+@pytest.mark.xdist_group(name="backup_ddb")
 class TestCheckDynamoDBBackupStatus:
     """Test DynamoDB backup status checking"""
 
@@ -211,7 +184,7 @@ class TestCheckDynamoDBBackupStatus:
             ]
         }
 
-        result = check_dynamodb_backup_status()
+        result = app.check_dynamodb_backup_status()
 
         assert result["status"] == "healthy"
         assert result["point_in_time_recovery"]["enabled"] is True
@@ -236,7 +209,7 @@ class TestCheckDynamoDBBackupStatus:
 
         mock_client.list_backups.return_value = {"BackupSummaries": []}
 
-        result = check_dynamodb_backup_status()
+        result = app.check_dynamodb_backup_status()
 
         assert result["status"] == "unhealthy"
         assert result["point_in_time_recovery"]["enabled"] is False
@@ -247,7 +220,7 @@ class TestCheckDynamoDBBackupStatus:
     ):
         """Test DynamoDB backup status with no table configured"""
         with patch.dict(os.environ, {"USAGE_TABLE_NAME": ""}):
-            result = check_dynamodb_backup_status()
+            result = app.check_dynamodb_backup_status()
 
             assert result["status"] == "unknown"
             assert "error" in result
@@ -262,12 +235,13 @@ class TestCheckDynamoDBBackupStatus:
             operation_name="DescribeContinuousBackups",
         )
 
-        result = check_dynamodb_backup_status()
+        result = app.check_dynamodb_backup_status()
 
         assert result["status"] == "error"
         assert "error" in result
 
 
+@pytest.mark.xdist_group(name="backup_s3")
 class TestCheckS3BackupStatus:
     """Test S3 backup status checking"""
 
@@ -288,7 +262,7 @@ class TestCheckS3BackupStatus:
         # Mock backup bucket check
         mock_client.head_bucket.return_value = {}
 
-        result = check_s3_backup_status()
+        result = app.check_s3_backup_status()
 
         assert result["status"] == "healthy"
         assert result["primary_bucket"]["versioning"] == "Enabled"
@@ -309,7 +283,7 @@ class TestCheckS3BackupStatus:
             operation_name="GetBucketReplication",
         )
 
-        result = check_s3_backup_status()
+        result = app.check_s3_backup_status()
 
         assert result["primary_bucket"]["replication"] == "disabled"
 
@@ -317,7 +291,7 @@ class TestCheckS3BackupStatus:
     def test_check_s3_backup_status_no_bucket(self, mock_boto_client, mock_env_vars):
         """Test S3 backup status with no bucket configured"""
         with patch.dict(os.environ, {"MANUALS_BUCKET": ""}):
-            result = check_s3_backup_status()
+            result = app.check_s3_backup_status()
 
             assert result["status"] == "unknown"
             assert "error" in result
@@ -326,61 +300,51 @@ class TestCheckS3BackupStatus:
 class TestVerifyBackupIntegrity:
     """Test backup integrity verification"""
 
-    @patch("app.verify_dynamodb_backup")
-    @patch("app.verify_s3_backup")
+    @patch("backup.app.verify_dynamodb_backup")
+    @patch("backup.app.verify_s3_backup")
     def test_verify_backup_integrity_success(
-        self, mock_s3_verify, mock_dynamodb_verify
+        self, mock_s3_verify, mock_dynamodb_verify, patched_logger
     ):
         """Test successful backup integrity verification"""
         mock_dynamodb_verify.return_value = {"status": "passed"}
         mock_s3_verify.return_value = {"status": "passed"}
 
-        with patch("app.get_logger") as mock_logger:
-            mock_logger.return_value = Mock()
-
-            result = verify_backup_integrity(
-                ["dynamodb", "s3"], mock_logger.return_value
-            )
+        result = app.verify_backup_integrity(["dynamodb", "s3"], patched_logger)
 
-            assert result["overall_status"] == "healthy"
-            assert len(result["services"]) == 2
-            assert "failed_services" not in result
+        assert result["overall_status"] == "healthy"
+        assert len(result["services"]) == 2
+        assert "failed_services" not in result
 
-    @patch("app.verify_dynamodb_backup")
-    @patch("app.verify_s3_backup")
+    @patch("backup.app.verify_dynamodb_backup")
+    @patch("backup.app.verify_s3_backup")
     def test_verify_backup_integrity_failures(
-        self, mock_s3_verify, mock_dynamodb_verify
+        self, mock_s3_verify, mock_dynamodb_verify, patched_logger
     ):
         """Test backup integrity verification with failures"""
         mock_dynamodb_verify.return_value = {"status": "failed"}
         mock_s3_verify.return_value = {"status": "passed"}
 
-        with patch("app.get_logger") as mock_logger:
-            mock_logger.return_value = Mock()
-
-            result = verify_backup_integrity(
-                ["dynamodb", "s3"], mock_logger.return_value
-            )
+        result = app.verify_backup_integrity(["dynamodb", "s3"], patched_logger)
 
-            assert result["overall_status"] == "failed"
-            assert "failed_services" in result
-            assert "dynamodb" in result["failed_services"]
+        assert result["overall_status"] == "failed"
+        assert "failed_services" in result
+        assert "dynamodb" in result["failed_services"]
 
-    def test_verify_backup_integrity_unsupported_service(self):
+    def test_verify_backup_integrity_unsupported_service(self, patched_logger):
         """Test backup integrity verification with unsupported service"""
-        with patch("app.get_logger") as mock_logger:
-            mock_logger.return_value = Mock()
+        result = app.verify_backup_integrity(["unsupported"], patched_logger)
 
-            result = verify_backup_integrity(["unsupported"], mock_logger.return_value)
-
-            assert result["services"]["unsupported"]["status"] == "skipped"
+        assert result["services"]["unsupported"]["status"] == "skipped"
 
 
+@pytest.mark.xdist_group(name="backup_ddb_verify")
 class TestVerifyDynamoDBBackup:
     """Test DynamoDB backup verification"""
 
     @patch("boto3.client")
-    def test_verify_dynamodb_backup_success(self, mock_boto_client, mock_env_vars):
+    def test_verify_dynamodb_backup_success(
+        self, mock_boto_client, mock_env_vars, patched_logger
+    ):
         """Test successful DynamoDB backup verification"""
         mock_client = Mock()
         mock_boto_client.return_value = mock_client
@@ -390,25 +354,27 @@ class TestVerifyDynamoDBBackup:
             "BackupSummaries": [{"BackupArn": "arn:aws:dynamodb:..."}]
         }
 
-        with patch("app.get_logger") as mock_logger:
-            result = verify_dynamodb_backup(mock_logger.return_value)
+        result = app.verify_dynamodb_backup(patched_logger)
 
-            assert result["status"] == "passed"
-            assert result["table_status"] == "ACTIVE"
-            assert result["backup_count"] == 1
+        assert result["status"] == "passed"
+        assert result["table_status"] == "ACTIVE"
+        assert result["backup_count"] == 1
 
     @patch("boto3.client")
-    def test_verify_dynamodb_backup_no_table(self, mock_boto_client, mock_env_vars):
+    def test_verify_dynamodb_backup_no_table(
+        self, mock_boto_client, mock_env_vars, patched_logger
+    ):
         """Test DynamoDB backup verification with no table"""
         with patch.dict(os.environ, {"USAGE_TABLE_NAME": ""}):
-            with patch("app.get_logger") as mock_logger:
-                result = verify_dynamodb_backup(mock_logger.return_value)
+            result = app.verify_dynamodb_backup(patched_logger)
 
-                assert result["status"] == "failed"
-                assert "Table name not configured" in result["error"]
+            assert result["status"] == "failed"
+            assert "Table name not configured" in result["error"]
 
     @patch("boto3.client")
-    def test_verify_dynamodb_backup_error(self, mock_boto_client, mock_env_vars):
+    def test_verify_dynamodb_backup_error(
+        self, mock_boto_client, mock_env_vars, patched_logger
+    ):
         """Test DynamoDB backup verification with error"""
         mock_client = Mock()
         mock_boto_client.return_value = mock_client
@@ -417,18 +383,20 @@ class TestVerifyDynamoDBBackup:
             operation_name="DescribeTable",
         )
 
-        with patch("app.get_logger") as mock_logger:
-            result = verify_dynamodb_backup(mock_logger.return_value)
+        result = app.verify_dynamodb_backup(patched_logger)
 
-            assert result["status"] == "failed"
-            assert "error" in result
+        assert result["status"] == "failed"
+        assert "error" in result
 
 
+@pytest.mark.xdist_group(name="backup_s3_verify")
 class TestVerifyS3Backup:
     """Test S3 backup verification"""
 
     @patch("boto3.client")
-    def test_verify_s3_backup_success(self, mock_boto_client, mock_env_vars):
+    def test_verify_s3_backup_success(
+        self, mock_boto_client, mock_env_vars, patched_logger
+    ):
         """Test successful S3 backup verification"""
         mock_client = Mock()
         mock_boto_client.return_value = mock_client
@@ -442,15 +410,16 @@ class TestVerifyS3Backup:
         }
         mock_client.head_object.return_value = {}  # Successful head_object calls
 
-        with patch("app.get_logger") as mock_logger:
-            result = verify_s3_backup(mock_logger.return_value)
+        result = app.verify_s3_backup(patched_logger)
 
-            assert result["status"] == "passed"
-            assert result["total_objects"] == 3
-            assert result["verified_objects"] == 3
+        assert result["status"] == "passed"
+        assert result["total_objects"] == 3
+        assert result["verified_objects"] == 3
 
     @patch("boto3.client")
-    def test_verify_s3_backup_partial_success(self, mock_boto_client, mock_env_vars):
+    def test_verify_s3_backup_partial_success(
+        self, mock_boto_client, mock_env_vars, patched_logger
+    ):
         """Test S3 backup verification with partial success"""
         mock_client = Mock()
         mock_boto_client.return_value = mock_client
@@ -468,55 +437,55 @@ class TestVerifyS3Backup:
             ),
         ]
 
-        with patch("app.get_logger") as mock_logger:
-            result = verify_s3_backup(mock_logger.return_value)
+        result = app.verify_s3_backup(patched_logger)
 
-            assert result["status"] == "degraded"
-            assert result["verified_objects"] == 1
+        assert result["status"] == "degraded"
+        assert result["verified_objects"] == 1
 
     @patch("boto3.client")
-    def test_verify_s3_backup_no_bucket(self, mock_boto_client, mock_env_vars):
+    def test_verify_s3_backup_no_bucket(
+        self, mock_boto_client, mock_env_vars, patched_logger
+    ):
         """Test S3 backup verification with no bucket"""
         with patch.dict(os.environ, {"MANUALS_BUCKET": ""}):
-            with patch("app.get_logger") as mock_logger:
-                result = verify_s3_backup(mock_logger.return_value)
+            result = app.verify_s3_backup(patched_logger)
 
-                assert result["status"] == "failed"
-                assert "Primary bucket name not configured" in result["error"]
+            assert result["status"] == "failed"
+            assert "Primary bucket name not configured" in result["error"]
 
 
 class TestInitiateDisasterRecovery:
     """Test disaster recovery initiation"""
 
-    @patch("app.initiate_dynamodb_recovery")
-    def test_initiate_disaster_recovery_success(self, mock_dynamodb_recovery):
+    @patch("backup.app.initiate_dynamodb_recovery")
+    def test_initiate_disaster_recovery_success(
+        self, mock_dynamodb_recovery, patched_logger
+    ):
         """Test successful disaster recovery initiation"""
         mock_dynamodb_recovery.return_value = {
             "status": "simulated",
             "recovery_table": "test-table-recovery-123",
         }
 
-        with patch("app.get_logger") as mock_logger:
-            result = initiate_disaster_recovery(
-                "point_in_time",
-                "2024-01-01T12:00:00Z",
-                ["dynamodb"],
-                mock_logger.return_value,
-            )
+        result = app.initiate_disaster_recovery(
+            "point_in_time",
+            "2024-01-01T12:00:00Z",
+            ["dynamodb"],
+            patched_logger,
+        )
 
-            assert result["status"] == "initiated"
-            assert result["recovery_type"] == "point_in_time"
-            assert "recovery_id" in result
-            assert "dynamodb" in result["services"]
+        assert result["status"] == "initiated"
+        assert result["recovery_type"] == "point_in_time"
+        assert "recovery_id" in result
+        assert "dynamodb" in result["services"]
 
-    def test_initiate_disaster_recovery_unsupported_service(self):
+    def test_initiate_disaster_recovery_unsupported_service(self, patched_logger):
         """Test disaster recovery with unsupported service"""
-        with patch("app.get_logger") as mock_logger:
-            result = initiate_disaster_recovery(
-                "point_in_time", None, ["unsupported"], mock_logger.return_value
-            )
+        result = app.initiate_disaster_recovery(
+            "point_in_time", None, ["unsupported"], patched_logger
+        )
 
-            assert result["services"]["unsupported"]["status"] == "skipped"
+        assert result["services"]["unsupported"]["status"] == "skipped"
 
 
 class TestGetBackupMetrics:
@@ -524,7 +493,7 @@ class TestGetBackupMetrics:
 
     def test_get_backup_metrics_success(self, mock_env_vars):
         """Test successful backup metrics retrieval"""
-        result = get_backup_metrics()
+        result = app.get_backup_metrics()
 
         assert "timestamp" in result
         assert "retention_policies" in result
@@ -539,48 +508,38 @@ class TestGetBackupMetrics:
 class TestBackupErrorHandling:
     """Test error handling scenarios"""
 
-    def test_handle_backup_status_exception(self):
+    def test_handle_backup_status_exception(self, assert_error, patched_logger):
         """Test backup status handling with exception"""
-        with (
-            patch("app.get_backup_status", side_effect=Exception("Service error")),
-            patch("app.get_logger") as mock_logger,
+        with patch(
+            "backup.app.get_backup_status", side_effect=Exception("Service error")
         ):
+            result = app.handle_backup_status(patched_logger)
 
-            result = handle_backup_status(mock_logger.return_value)
-
-            assert result["statusCode"] == 500
-            response_body = json.loads(result["body"])
-            assert "error" in response_body
+            assert_error(result, 500)
 
-    def test_handle_backup_verify_invalid_body(self):
+    def test_handle_backup_verify_invalid_body(self, assert_error, patched_logger):
         """Test backup verification with invalid request body"""
         event = {"body": "invalid json {"}
 
-        with patch("app.get_logger") as mock_logger:
-            result = handle_backup_verify(event, mock_logger.return_value)
+        result = app.handle_backup_verify(event, patched_logger)
 
-            assert result["statusCode"] == 500
-            response_body = json.loads(result["body"])
-            assert "error" in response_body
+        assert_error(result, 500)
 
-    def test_handle_disaster_recovery_invalid_body(self):
+    def test_handle_disaster_recovery_invalid_body(self, assert_error, patched_logger):
         """Test disaster recovery with invalid request body"""
         event = {"body": "invalid json {"}
 
-        with patch("app.get_logger") as mock_logger:
-            result = handle_disaster_recovery(event, mock_logger.return_value)
+        result = app.handle_disaster_recovery(event, patched_logger)
 
-            assert result["statusCode"] == 500
-            response_body = json.loads(result["body"])
-            assert "error" in response_body
+        assert_error(result, 500)
 
 
 class TestBackupStatusHealthChecks:
     """Test comprehensive health check scenarios"""
 
-    @patch("app.check_dynamodb_backup_status")
-    @patch("app.check_s3_backup_status")
-    @patch("app.check_opensearch_backup_status")
+    @patch("backup.app.check_dynamodb_backup_status")
+    @patch("backup.app.check_s3_backup_status")
+    @patch("backup.app.check_opensearch_backup_status")
     def test_backup_health_check_comprehensive(
         self, mock_opensearch, mock_s3, mock_dynamodb
     ):
@@ -599,7 +558,7 @@ class TestBackupStatusHealthChecks:
 
         mock_opensearch.return_value = {"status": "not_implemented"}
 
-        result = get_backup_status()
+        result = app.get_backup_status()
 
         assert (
             result["overall_status"] == "degraded"
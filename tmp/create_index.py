@@ -8,9 +8,9 @@ import sys
 from urllib.parse import urlparse
 
 import boto3
-import requests
 from botocore.auth import SigV4Auth
 from botocore.awsrequest import AWSRequest
+from botocore.httpsession import URLLib3Session
 
 
 def create_opensearch_index():
@@ -54,25 +54,26 @@ def create_opensearch_index():
 
     url = f"{endpoint}/{index_name}"
 
+    # Serialize once; the same bytes are hashed for the signature and sent
+    body = json.dumps(index_config).encode("utf-8")
+
     # Create AWS request
     request = AWSRequest(
         method="PUT",
         url=url,
-        data=json.dumps(index_config),
+        data=body,
         headers={"Content-Type": "application/json"},
     )
 
     # Sign the request
     SigV4Auth(credentials, "aoss", region).add_auth(request)
 
-    # Send the request
-    response = requests.put(
-        url, data=json.dumps(index_config), headers=dict(request.headers)
-    )
+    # Send the signed request with botocore's own HTTP session
+    response = URLLib3Session().send(request.prepare())
 
     if response.status_code == 200:
         print(f"✅ Index '{index_name}' created successfully!")
-        print(f"Response: {response.json()}")
+        print(f"Response: {json.loads(response.content)}")
     else:
         print(f"❌ Failed to create index '{index_name}'")
         print(f"Status: {response.status_code}")